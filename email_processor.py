@@ -1,17 +1,73 @@
 import os
-from compoundfiles import CompoundFileReader
+import binascii
+import struct
+from contextlib import contextmanager
 from email import policy
 from email.parser import BytesParser
 from datetime import datetime, timedelta
 import io
 import warnings
 
-# Suppress all warnings from compoundfiles.streams (temporary workaround)
-warnings.filterwarnings("ignore", category=Warning, module="compoundfiles.streams")
+# Origin of MAPI FILETIME values, which count 100-nanosecond intervals.
+_EPOCH_1601 = datetime(1601, 1, 1)
+
+# Approximate size of each encoded slice decoded when writing .eml attachments.
+_CHUNK_SIZE = 64 * 1024
+
+# Content-Transfer-Encodings that can be decoded a slice of whole lines at a time.
+_CTE_DECODERS = {"base64": binascii.a2b_base64, "quoted-printable": binascii.a2b_qp}
+
+
+def _iter_line_chunks(text, size=_CHUNK_SIZE):
+    """Yield successive slices of text of about size characters, cut after a newline."""
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + size)
+        end = len(text) if end == -1 else end + 1
+        yield text[start:end]
+        start = end
+
+
+# Reusable write buffers, shared by every attachment saved in this process.
+_BUF_POOL = []
+
+
+@contextmanager
+def _borrow(size):
+    """Lend a pooled bytearray of at least size bytes for the duration of the block."""
+    for i, buf in enumerate(_BUF_POOL):
+        if len(buf) >= size:
+            del _BUF_POOL[i]
+            break
+    else:
+        buf = bytearray(size)
+    try:
+        yield buf
+    finally:
+        _BUF_POOL.append(buf)
+
+
+def _write_all(f, data):
+    """Write all of data to an unbuffered file, which may accept only part per call."""
+    with memoryview(data) as view:
+        while view:
+            view = view[f.write(view):]
+
+
+def _fill(stream, view):
+    """Fill view from a compoundfiles stream, which lacks readinto; return the byte count."""
+    filled = 0
+    while filled < len(view):
+        chunk = stream.read1(len(view) - filled)
+        if not chunk:
+            break
+        view[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+    return filled
 
 class EmailProcessor:
     """Processes .msg and .eml files to extract metadata and attachments."""
-    
+
     def __init__(self, file_path, output_dir):
         self.file_path = file_path
         self.output_dir = output_dir
@@ -21,100 +77,135 @@ class EmailProcessor:
 
     def process(self):
         """Process the email file based on its extension."""
-        if self.file_path.lower().endswith('.msg'):
+        ext = os.path.splitext(self.file_path)[1].lower()
+        if ext == '.msg':
             self._process_msg()
-        elif self.file_path.lower().endswith('.eml'):
+        elif ext == '.eml':
             self._process_eml()
         return self.email_data, self.attachments
 
-    def _parse_filetime(self, data):
+    @staticmethod
+    def _decode_utf16(data):
+        """Decode a MAPI Unicode string stream, dropping trailing NULs."""
+        end = len(data.rstrip(b'\x00'))
+        # Keep the zero high byte of a final code unit such as 'A\x00'.
+        return data[:end + (end & 1)].decode('utf-16-le', errors='ignore')
+
+    @staticmethod
+    def _parse_filetime(data):
         """Parse MAPI FILETIME to datetime."""
         try:
-            filetime = int.from_bytes(data, 'little')
-            epoch = datetime(1601, 1, 1)
-            return epoch + timedelta(microseconds=filetime / 10)
+            filetime = struct.unpack_from('<Q', data)[0]
+            seconds, hundred_ns = divmod(filetime, 10_000_000)
+            return _EPOCH_1601 + timedelta(seconds=seconds, microseconds=hundred_ns // 10)
         except Exception as e:
             print(f"Error parsing FILETIME: {e}")
             return "Unknown"
 
+    # Top-level .msg property streams, mapped to (email_data key, decoder).
+    _META_MAP = {
+        '__substg1.0_0C1A001F': ("From", _decode_utf16.__func__),
+        '__substg1.0_0037001F': ("Subject", _decode_utf16.__func__),
+        '__substg1.0_1000001F': ("Body", _decode_utf16.__func__),
+        '__substg1.0_0E03001F': ("CC", _decode_utf16.__func__),
+        '__substg1.0_00390040': ("Sent On", _parse_filetime.__func__),
+        '__substg1.0_0E060040': ("Sent On", _parse_filetime.__func__),
+    }
+
+    # Streams read from an attach_version directory, mapped to their attachment field;
+    # others are never opened.
+    _ATTACH_STREAMS = {
+        '__substg1.0_37010102': "data_entry",
+        '__substg1.0_370E001F': "filename",
+        '__substg1.0_3707001F': "filename",
+        '__substg1.0_3704001F': "mime_type",
+    }
+
+    # Recipient email address stream within a recip_version directory.
+    _RECIP_STREAM = '__substg1.0_3003001F'
+
+    # Characters not allowed in Windows filenames, replaced with '.' when saving attachments.
+    _FNAME_TRANS = str.maketrans({c: '.' for c in '<>:"/\\|?*'})
+
     def _process_msg(self):
         """Process .msg file using CompoundFileReader."""
-        try:
-            with CompoundFileReader(self.file_path) as doc:
-                for entry in doc.root:
-                    try:
-                        self._extract_metadata(entry, doc)
-                        self._extract_recipients(entry, doc)
-                        self._extract_attachment(entry, doc)
-                    except Exception as e:
-                        print(f"Error processing entry {entry.name}: {e}")
-        except Exception as e:
-            print(f"Failed to process .msg file {self.file_path}: {e}")
+        from compoundfiles import CompoundFileReader
 
-    def _extract_metadata(self, entry, doc):
-        """Extract metadata from .msg streams."""
-        if not entry.isdir:
+        dir_handlers = {
+            '__recip_version1.0_': self._extract_recipients,
+            '__attach_version1.0_': self._extract_attachment,
+        }
+        # Suppress all warnings from compoundfiles.streams (temporary workaround)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=Warning, module="compoundfiles.streams")
             try:
-                with doc.open(entry) as stream:  # Use context manager
-                    if stream is None:
-                        print(f"Stream is None for entry: {entry.name}")
-                        return
-                    data = stream.read()
-                    mappings = {
-                        '__substg1.0_0C1A001F': ("From", lambda x: x.decode('utf-16-le', errors='ignore').rstrip('\x00')),
-                        '__substg1.0_0037001F': ("Subject", lambda x: x.decode('utf-16-le', errors='ignore').rstrip('\x00')),
-                        '__substg1.0_1000001F': ("Body", lambda x: x.decode('utf-16-le', errors='ignore').rstrip('\x00')),
-                        '__substg1.0_0E03001F': ("CC", lambda x: x.decode('utf-16-le', errors='ignore').rstrip('\x00')),
-                        '__substg1.0_00390040': ("Sent On", self._parse_filetime),
-                        '__substg1.0_0E060040': ("Sent On", self._parse_filetime),
-                    }
-                    if entry.name in mappings and (mappings[entry.name][0] != "Sent On" or not self.email_data["Sent On"]):
-                        key, func = mappings[entry.name]
-                        self.email_data[key] = func(data)
+                with CompoundFileReader(self.file_path) as doc:
+                    for entry in doc.root:
+                        try:
+                            if entry.isdir:
+                                for prefix, handler in dir_handlers.items():
+                                    if entry.name.startswith(prefix):
+                                        handler(entry, doc)
+                                        break
+                            else:
+                                self._extract_metadata(entry, doc)
+                        except Exception as e:
+                            print(f"Error processing entry {entry.name}: {e}")
             except Exception as e:
-                print(f"Error extracting metadata from {entry.name}: {e}")
+                print(f"Failed to process .msg file {self.file_path}: {e}")
 
-    def _extract_recipients(self, entry, doc):
-        """Extract recipients from .msg recip_version directories."""
-        if entry.isdir and entry.name.startswith('__recip_version1.0_'):
-            for recip_stream in entry:
-                if recip_stream.name == '__substg1.0_3003001F':
-                    try:
-                        with doc.open(recip_stream) as stream:  # Use context manager
-                            if stream is None:
-                                print(f"Stream is None for recipient: {recip_stream.name}")
-                                continue
-                            recipient = stream.read().decode('utf-16-le', errors='ignore').rstrip('\x00')
-                            self.email_data["To"].append(recipient)
-                    except Exception as e:
-                        print(f"Error extracting recipient from {recip_stream.name}: {e}")
+    def _extract_metadata(self, entry, doc):
+        """Extract metadata from a .msg property stream."""
+        entry_info = self._META_MAP.get(entry.name)
+        if entry_info is None:
+            return
+        key, decode = entry_info
+        if key == "Sent On" and self.email_data["Sent On"]:
+            return
+        with doc.open(entry) as stream:  # Use context manager
+            if stream is None:
+                print(f"Stream is None for entry: {entry.name}")
+                return
+            self.email_data[key] = decode(stream.read())
 
-    def _extract_attachment(self, entry, doc):
-        """Extract and save attachments from .msg."""
-        if entry.isdir and entry.name.startswith('__attach_version1.0_'):
-            attachment = {"data": None, "filename": None, "mime_type": None}
-            for stream_entry in entry:
-                if not stream_entry.isdir:
-                    try:
-                        with doc.open(stream_entry) as stream:  # Use context manager
-                            if stream is None:
-                                print(f"Stream is None for attachment: {stream_entry.name}")
-                                continue
-                            data = stream.read()
-                            if stream_entry.name == '__substg1.0_37010102':
-                                attachment["data"] = data
-                            elif stream_entry.name in ('__substg1.0_370E001F', '__substg1.0_3707001F'):
-                                attachment["filename"] = data.decode('utf-16-le', errors='ignore').rstrip('\x00')
-                            elif stream_entry.name == '__substg1.0_3704001F':
-                                attachment["mime_type"] = data.decode('utf-16-le', errors='ignore').rstrip('\x00')
-                    except Exception as e:
-                        print(f"Error extracting attachment from {stream_entry.name}: {e}")
-            if attachment["data"]:
+    def _extract_recipients(self, entry, doc):
+        """Extract recipients from a .msg recip_version directory."""
+        for recip_stream in entry:
+            if not recip_stream.isdir and recip_stream.name == self._RECIP_STREAM:
                 try:
-                    filename = self._save_attachment(attachment, entry.name)
-                    self.attachments.append(filename)
+                    with doc.open(recip_stream) as stream:  # Use context manager
+                        if stream is None:
+                            print(f"Stream is None for recipient: {recip_stream.name}")
+                            continue
+                        recipient = self._decode_utf16(stream.read())
+                        self.email_data["To"].append(recipient)
                 except Exception as e:
-                    print(f"Error saving attachment for {entry.name}: {e}")
+                    print(f"Error extracting recipient from {recip_stream.name}: {e}")
+
+    def _extract_attachment(self, entry, doc):
+        """Extract and save an attachment from a .msg attach_version directory."""
+        attachment = {"data_entry": None, "filename": None, "mime_type": None}
+        for stream_entry in entry:
+            field = self._ATTACH_STREAMS.get(stream_entry.name)
+            if field is None or stream_entry.isdir:
+                continue
+            if field == "data_entry":
+                attachment[field] = stream_entry  # Streamed to disk by _save_attachment
+                continue
+            try:
+                with doc.open(stream_entry) as stream:  # Use context manager
+                    if stream is None:
+                        print(f"Stream is None for attachment: {stream_entry.name}")
+                        continue
+                    attachment[field] = self._decode_utf16(stream.read())
+            except Exception as e:
+                print(f"Error extracting attachment from {stream_entry.name}: {e}")
+        if attachment["data_entry"] is not None and attachment["data_entry"].size:
+            try:
+                filename = self._save_attachment(attachment, entry.name, doc)
+                self.attachments.append(filename)
+            except Exception as e:
+                print(f"Error saving attachment for {entry.name}: {e}")
 
     def _process_eml(self):
         """Process .eml file using email.parser."""
@@ -134,47 +225,88 @@ class EmailProcessor:
         self._extract_eml_attachments(msg)
 
     def _extract_eml_body(self, msg):
-        """Extract body from .eml file."""
-        body_found = False
-        for part in msg.walk():
-            if part.get_content_type().startswith("text/") and not part.get("Content-Disposition"):
-                try:
-                    body = part.get_payload(decode=True)
-                    if body:
-                        self.email_data["Body"] = body.decode("utf-8", errors="ignore").strip()
-                        body_found = True
-                        break
-                except Exception as e:
-                    print(f"Error decoding body: {e}")
-        if not body_found:
-            self.email_data["Body"] = "No body content found in .eml file."
+        """Extract body from .eml file, preferring text/plain over text/html."""
+        part = msg.get_body(preferencelist=("plain", "html"))
+        if part is None:
+            # No plain or HTML body; fall back to any other inline text part (e.g. text/enriched).
+            part = next(self._iter_text_parts(msg), None)
+        if part is not None:
+            try:
+                body = part.get_payload(decode=True)
+                if body:
+                    try:
+                        text = body.decode(part.get_content_charset() or "utf-8", errors="ignore")
+                    except LookupError:
+                        text = body.decode("utf-8", errors="ignore")
+                    self.email_data["Body"] = text.strip()
+                    return
+            except Exception as e:
+                print(f"Error decoding body: {e}")
+        self.email_data["Body"] = "No body content found in .eml file."
+
+    def _iter_text_parts(self, msg):
+        """Yield non-attachment text/* parts, skipping the contents of attached messages."""
+        if msg.get_content_maintype() == "multipart":
+            for part in msg.iter_parts():
+                yield from self._iter_text_parts(part)
+        elif msg.get_content_maintype() == "text" and msg.get_content_disposition() != "attachment":
+            yield msg
 
     def _extract_eml_attachments(self, msg):
         """Extract attachments from .eml file."""
-        for part in msg.walk():
-            if part.get("Content-Disposition") and "attachment" in part.get("Content-Disposition"):
-                filename = part.get_filename() or f"attachment_{len(self.attachments)}.bin"
-                filepath = os.path.join(self.output_dir, filename)
-                with open(filepath, "wb") as f:
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        f.write(payload)
-                self.attachments.append(filename)
-                print(f"Saved attachment: {filepath}")
+        for part in self._iter_attachment_parts(msg):
+            filename = part.get_filename() or f"attachment_{len(self.attachments)}.bin"
+            filepath = os.path.join(self.output_dir, filename)
+            with open(filepath, "wb", buffering=0) as f:
+                self._write_eml_payload(part, f)
+            self.attachments.append(filename)
+            print(f"Saved attachment: {filepath}")
+
+    def _iter_attachment_parts(self, msg):
+        """Yield parts with an attachment disposition, including those inside attached messages."""
+        if msg.get_content_maintype() == "multipart":
+            for part in msg.iter_parts():
+                yield from self._iter_attachment_parts(part)
+            return
+        if msg.get_content_disposition() == "attachment":
+            yield msg
+        if msg.get_content_type() == "message/rfc822":
+            # Attachments of a forwarded message live inside the attached message.
+            yield from self._iter_attachment_parts(msg.get_payload(0))
+
+    def _write_eml_payload(self, part, f):
+        """Decode an .eml part's payload into f without materialising it whole."""
+        cte = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+        decoder = _CTE_DECODERS.get(cte)
+        if decoder is not None and not part.is_multipart():
+            try:
+                for chunk in _iter_line_chunks(part.get_payload()):
+                    _write_all(f, decoder(chunk))
+                return
+            except ValueError:
+                # Malformed encoding; let the email package's lenient decoder handle it.
+                f.seek(0)
+                f.truncate()
+        payload = part.get_payload(decode=True)
+        if payload:
+            _write_all(f, payload)
 
-    def _save_attachment(self, attachment, entry_name):
+    def _save_attachment(self, attachment, entry_name, doc):
         """Save attachment with proper filename."""
         mime_to_ext = {
             'application/pdf': '.pdf', 'text/plain': '.txt', 'image/jpeg': '.jpg',
             'image/png': '.png', 'application/msword': '.doc'
         }
         base_filename = attachment["filename"] or f"attachment_{entry_name[-8:]}"
-        for char in '<>:"/\\|?*':
-            base_filename = base_filename.replace(char, '.')
+        base_filename = base_filename.translate(self._FNAME_TRANS)
         ext = mime_to_ext.get(attachment["mime_type"], '.bin') if '.' not in base_filename else ''
         filename = base_filename + ext
         filepath = os.path.join(self.output_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(attachment["data"])
+        with doc.open(attachment["data_entry"]) as stream, open(filepath, "wb", buffering=0) as f, _borrow(_CHUNK_SIZE) as buf:
+            with memoryview(buf) as view:
+                filled = _fill(stream, view)
+                while filled:
+                    _write_all(f, view[:filled])
+                    filled = _fill(stream, view)
         print(f"Saved attachment: {filepath}")
         return filename
\ No newline at end of file
@@ -1,8 +1,143 @@
-from PyPDF2 import PdfWriter, PdfReader
 from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import io
-from textwrap import wrap
+from functools import lru_cache
+import re
+
+
+# Page layout in points, shared by PDFGenerator and the pre-built empty PDF.
+_MARGIN = 30
+_LINE_HEIGHT = 14
+_TOP_GAP = 20  # Between the top margin and the first line
+_LABEL_WIDTH = 80  # Header labels; values start this far right of the margin
+_ROW_GAP = 5  # After each header row
+_SECTION_GAP = 10  # Between headers, body and attachments
+
+# Splits text into alternating word and whitespace chunks, keeping the whitespace.
+_WHITESPACE_RE = re.compile(r"(\s+)")
+
+# reportlab's stringWidth, bound by _load_string_width on first use.
+_string_width = None
+
+
+def _load_string_width():
+    """Import stringWidth once; pdfmetrics is too slow to import with this module."""
+    global _string_width
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    _string_width = stringWidth
+    return stringWidth
+
+
+def _wrap_text_uncached(text, font_name, size, max_width):
+    """Wrap text to fit within max_width points, handling whitespace the way textwrap does.
+
+    Indentation and the spacing between words are kept; whitespace is only
+    dropped where a line is broken.
+    """
+    stringWidth = _string_width or _load_string_width()
+    limit = max_width + 0.001  # Tolerate float error in summed widths
+    widths = {}  # Words and spaces repeat within a text; measure each one once
+    lines = []
+    cur_line, cur_width = [], 0
+    for chunk in _WHITESPACE_RE.split(text.expandtabs()):
+        if not chunk:
+            continue
+        is_space = chunk.isspace()
+        if is_space:
+            if not cur_line and lines:
+                continue  # Whitespace at the start of a wrapped line is dropped
+            chunk = " " * len(chunk)
+        chunk_width = widths.get(chunk)
+        if chunk_width is None:
+            chunk_width = widths[chunk] = stringWidth(chunk, font_name, size)
+        if cur_width + chunk_width <= limit:
+            cur_line.append(chunk)
+            cur_width += chunk_width
+            continue
+        if chunk_width <= limit:
+            # End the line here; an overflowing space is dropped with the break.
+            if cur_line and cur_line[-1].isspace():
+                del cur_line[-1]
+            if cur_line:
+                lines.append("".join(cur_line))
+            cur_line, cur_width = ([], 0) if is_space else ([chunk], chunk_width)
+            continue
+        # Break a chunk wider than a whole line in one pass over its characters:
+        # fill the space left on this line, then whole lines, and keep the rest.
+        begin, line_width = 0, cur_width
+        for i, char in enumerate(chunk):
+            char_width = widths.get(char)
+            if char_width is None:
+                char_width = widths[char] = stringWidth(char, font_name, size)
+            if line_width + char_width > limit and (i > begin or cur_line):
+                if i > begin:
+                    cur_line.append(chunk[begin:i])
+                if cur_line and cur_line[-1].isspace():
+                    del cur_line[-1]
+                if cur_line:
+                    lines.append("".join(cur_line))
+                cur_line, cur_width, begin, line_width = [], 0, i, 0
+            line_width += char_width
+        if is_space and lines and not cur_line:
+            continue  # The leftover space starts a wrapped line, so it is dropped
+        cur_line.append(chunk[begin:])
+        cur_width = line_width
+    if cur_line and cur_line[-1].isspace():
+        del cur_line[-1]
+    if cur_line:
+        lines.append("".join(cur_line))
+    return tuple(lines)
+
+
+# Short strings (header values, attachment names, short body lines) repeat across
+# calls and are cheap to keep; longer paragraphs are wrapped without caching so the
+# module-level cache never holds earlier emails' bodies.
+_WRAP_CACHE_MAX_LEN = 80
+_wrap_text_cached = lru_cache(maxsize=256)(_wrap_text_uncached)
+
+
+def _wrap_text(text, font_name, size, max_width):
+    """Wrap text to fit within max_width points, memoising only short strings."""
+    if len(text) <= _WRAP_CACHE_MAX_LEN:
+        return _wrap_text_cached(text, font_name, size, max_width)
+    return _wrap_text_uncached(text, font_name, size, max_width)
+
+
+def _build_empty_pdf():
+    """Build the one-page PDF that generate() would render for an email with no content."""
+    # Same layout as a render of empty email_data: the "Sent On" row, then the notice
+    # below the header row, the blank body line and the gaps around it.
+    width, height = letter
+    row_y = height - _MARGIN - _TOP_GAP
+    notice_y = row_y - _LINE_HEIGHT - _ROW_GAP - _SECTION_GAP - _LINE_HEIGHT - _SECTION_GAP
+    content = (
+        b"BT /F2 12 Tf 1 0 0 1 %d %d Tm (Sent On:) Tj ET\n" % (_MARGIN, row_y)
+        + b"BT /F1 12 Tf 1 0 0 1 %d %d Tm (Not Found) Tj ET\n" % (_MARGIN + _LABEL_WIDTH, row_y)
+        + b"BT /F1 12 Tf 1 0 0 1 %d %d Tm (No email content or attachments found.) Tj ET\n" % (_MARGIN, notice_y)
+    )
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+        b"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>" % (width, height),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n%sendstream" % (len(content), content),
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (num, obj)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+# Pre-built output for emails with no content or attachments; needs no reportlab at all.
+_EMPTY_PDF = _build_empty_pdf()
+
 
 class PDFGenerator:
     """Generates a PDF from email data and attachments."""
@@ -12,55 +147,100 @@ class PDFGenerator:
         self.attachments = attachments
         self.output_path = output_path
         self.width, self.height = letter  # 612 x 792 points
-        self.margin = 30
-        self.line_height = 14
+        self.margin = _MARGIN
+        self.line_height = _LINE_HEIGHT
+        self._font_helv = "Helvetica"
+        self._font_helv_bold = "Helvetica-Bold"
+        self._current_font = (None, None)
 
     def generate(self):
         """Generate and save the PDF."""
-        packet = io.BytesIO()
-        can = canvas.Canvas(packet, pagesize=letter)
-        y = self.height - self.margin - 20
+        if not any(self.email_data.values()) and not self.attachments:
+            self._write_empty_pdf()
+            return
+
+        from reportlab.pdfgen import canvas
+
+        can = canvas.Canvas(self.output_path, pagesize=letter)
+        self._current_font = (None, None)
+        y = self.height - self.margin - _TOP_GAP
 
         y = self._draw_headers(can, y)
-        y -= 10
+        y -= _SECTION_GAP
         y = self._draw_body(can, y)
-        y -= 10
+        y -= _SECTION_GAP
         y = self._draw_attachments(can, y)
 
-        if not any(self.email_data.values()) and not self.attachments:
-            self._draw_text(can, "No email content or attachments found.", self.margin, y)
-
+        pages = can.getPageNumber()
         can.save()
-        self._save_pdf(packet)
+        print(f"Saved PDF to {self.output_path} with {pages} pages")
+
+    def _write_empty_pdf(self):
+        """Write the pre-built "no content" PDF."""
+        with open(self.output_path, "wb") as f:
+            f.write(_EMPTY_PDF)
+        print(f"Saved PDF to {self.output_path} with 1 pages")
 
     def _draw_text(self, can, text, x, y, font="Helvetica", size=12, bold=False):
         """Draw text with wrapping and page breaks."""
-        can.setFont(f"{font}{'-Bold' if bold else ''}", size)
-        wrapped_lines = wrap(text, width=int((self.width - 2 * self.margin) / (size * 0.6)))
-        for line in wrapped_lines:
+        if font == "Helvetica":
+            font_name = self._font_helv_bold if bold else self._font_helv
+        else:
+            font_name = f"{font}-Bold" if bold else font
+        self._set_font(can, font_name, size)
+        for line in _wrap_text(text, font_name, size, self.width - self.margin - x):
             if y < self.margin + 20:
-                can.showPage()
-                can.setFont(f"{font}{'-Bold' if bold else ''}", size)
-                y = self.height - self.margin - 20
+                y = self._new_page(can)
+                self._set_font(can, font_name, size)
             can.drawString(x, y, line)
             y -= self.line_height
         return y
 
+    def _set_font(self, can, font_name, size):
+        """Set the canvas font, skipping the PDF operator if it is already current."""
+        key = (font_name, size)
+        if key != self._current_font:
+            can.setFont(font_name, size)
+            self._current_font = key
+
+    def _new_page(self, can):
+        """Start a new page and return the y position of its first line."""
+        can.showPage()
+        self._current_font = (None, None)  # showPage() resets the font
+        return self.height - self.margin - _TOP_GAP
+
     def _draw_headers(self, can, y):
         """Draw email headers."""
-        label_width = 80
-        for key in ["From", "To", "Sent On", "CC", "Subject"]:
+        value_x = self.margin + _LABEL_WIDTH
+        max_width = self.width - self.margin - value_x
+        rows = []
+        for key in ("From", "To", "Sent On", "CC", "Subject"):
             value = self.email_data.get(key)
-            if value or key == "Sent On":
-                label = f"{key}:"
-                value_str = ", ".join(value) if key == "To" and value else str(value) if value else "Not Found"
-                if key == "Subject" and len(value_str) > 50:
-                    value_str = value_str[:47] + "..."
-                can.setFont("Helvetica-Bold", 12)
-                can.drawString(self.margin, y, label)
-                can.setFont("Helvetica", 12)
-                y = self._draw_text(can, value_str, self.margin + label_width, y)
-                y -= 5
+            if not value:
+                if key != "Sent On":
+                    continue
+                value_str = "Not Found"
+            elif isinstance(value, (list, tuple)):
+                value_str = ", ".join(value)
+            else:
+                value_str = str(value)
+            if key == "Subject" and len(value_str) > 50:
+                value_str = value_str[:47] + "..."
+            rows.append((f"{key}:", _wrap_text(value_str, self._font_helv, 12, max_width)))
+
+        for label, lines in rows:
+            if y < self.margin + 20:
+                y = self._new_page(can)
+            self._set_font(can, self._font_helv_bold, 12)
+            can.drawString(self.margin, y, label)
+            self._set_font(can, self._font_helv, 12)
+            for line in lines:
+                if y < self.margin + 20:
+                    y = self._new_page(can)
+                    self._set_font(can, self._font_helv, 12)
+                can.drawString(value_x, y, line)
+                y -= self.line_height
+            y -= _ROW_GAP
         return y
 
     def _draw_body(self, can, y):
@@ -68,18 +248,39 @@ class PDFGenerator:
         body = self.email_data.get("Body", "No body content found.")
         if body == None:
             body = ""
-        paragraphs = body.split('\n')
+        # Wrap every paragraph up front into (in_chain, x, line) rows; None marks a blank paragraph.
+        rows = []
         in_chain = False
-        for para in paragraphs:
+        for para in body.split('\n'):
             if para.startswith(">") or "-----Original Message-----" in para or "From:" in para:
                 in_chain = True
-                can.setFillColorRGB(0.5, 0.5, 0.5)
             elif in_chain and not para.strip():
                 in_chain = False
-                can.setFillColorRGB(0, 0, 0)
-            y = self._draw_text(can, para, self.margin + (10 if in_chain else 0), y)
-            if not para and y > self.margin:
-                y -= self.line_height
+            x = self.margin + (10 if in_chain else 0)
+            rows.extend((in_chain, x, line) for line in _wrap_text(para, self._font_helv, 12, self.width - self.margin - x))
+            if not para:
+                rows.append((in_chain, x, None))
+
+        self._set_font(can, self._font_helv, 12)
+        gray = False
+        for in_chain, x, line in rows:
+            if line is None:
+                if y > self.margin:
+                    y -= self.line_height
+                continue
+            if y < self.margin + 20:
+                # showPage() resets the font and fill color.
+                y = self._new_page(can)
+                self._set_font(can, self._font_helv, 12)
+                gray = False
+            if in_chain != gray:
+                if in_chain:
+                    can.setFillColorRGB(0.5, 0.5, 0.5)
+                else:
+                    can.setFillColorRGB(0, 0, 0)
+                gray = in_chain
+            can.drawString(x, y, line)
+            y -= self.line_height
         can.setFillColorRGB(0, 0, 0)
         return y
 
@@ -89,15 +290,4 @@ class PDFGenerator:
             y = self._draw_text(can, "Attachments:", self.margin, y, bold=True)
             for attach in self.attachments:
                 y = self._draw_text(can, f"- {attach}", self.margin + 10, y)
-        return y
-
-    def _save_pdf(self, packet):
-        """Save the PDF to disk."""
-        packet.seek(0)
-        pdf_reader = PdfReader(packet)
-        pdf_writer = PdfWriter()
-        for page in pdf_reader.pages:
-            pdf_writer.add_page(page)
-        with open(self.output_path, "wb") as f:
-            pdf_writer.write(f)
-        print(f"Saved PDF to {self.output_path} with {len(pdf_reader.pages)} pages")
\ No newline at end of file
+        return y
\ No newline at end of file